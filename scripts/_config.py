@@ -0,0 +1,18 @@
+"""
+Script Configuration
+
+Loads the project's .env file once and exposes the credentials shared by the
+scripts in this directory as module-level constants.
+"""
+
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ENV_PATH = Path(__file__).resolve().parent.parent / ".env"
+load_dotenv(dotenv_path=ENV_PATH)
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
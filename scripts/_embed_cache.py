@@ -0,0 +1,187 @@
+"""
+Embedding Cache
+
+Persistent on-disk cache for embeddings shared by the scripts in this
+directory. Embeddings are keyed by a SHA-256 hash of a namespace, the model
+name and the embedded text, so unchanged flavor tags and repeated search
+queries are served locally instead of calling the OpenAI API again. The
+namespace keeps a search query from colliding with a canonical tag key that
+has the same text.
+
+An in-process LRU cache sits in front of the SQLite store for repeated lookups
+within a single run, and an opt-in fuzzy index can reuse the embedding of a
+recently seen set of flavor tags that differs from a new one only by typos.
+"""
+
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CACHE_PATH = Path(__file__).resolve().parent / "embeddings.sqlite"
+MEMORY_CACHE_SIZE = 4096  # Embeddings kept in process memory
+FUZZY_THRESHOLD = 1.0  # Minimum per-tag spelling similarity for fuzzy reuse; 1.0 disables it
+FUZZY_CANDIDATES = 1024  # Recent keys compared on a fuzzy lookup
+MAX_TYPO_EDITS = 2  # Most single-character edits between a tag and its corrected spelling
+QUERY_NAMESPACE = "query"  # Keys of free-text search queries
+TAGS_NAMESPACE = "tags"  # Keys of canonical flavor tag strings
+
+
+@lru_cache(maxsize=None)
+def _connect() -> sqlite3.Connection:
+    """Open the cache database, creating it on first use."""
+    connection = sqlite3.connect(CACHE_PATH)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "key BLOB PRIMARY KEY, "
+        "model TEXT NOT NULL, "
+        "vec BLOB NOT NULL)"
+    )
+    return connection
+
+
+def cache_key(namespace: str, text: str, model: str) -> bytes:
+    """Build the cache key for a text in a namespace embedded with the given model."""
+    return hashlib.sha256((namespace + "\x00" + model + "\x00" + text).encode()).digest()
+
+
+@lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def _load(namespace: str, text: str, model: str) -> np.ndarray:
+    """Load a cached embedding, raising KeyError on a miss so misses are not memoized."""
+    row = _connect().execute(
+        "SELECT vec FROM cache WHERE key = ?", (cache_key(namespace, text, model),)
+    ).fetchone()
+    if row is None:
+        raise KeyError(text)
+
+    embedding = np.frombuffer(row[0], dtype=np.float32)
+    embedding.flags.writeable = False
+    return embedding
+
+
+def get(namespace: str, text: str, model: str) -> Optional[List[float]]:
+    """Return the cached embedding for a text, or None if it has not been cached."""
+    try:
+        return _load(namespace, text, model).tolist()
+    except KeyError:
+        return None
+
+
+def put(namespace: str, text: str, model: str, embedding: Sequence[float]) -> None:
+    """Store an embedding in the cache."""
+    connection = _connect()
+    connection.execute(
+        "INSERT OR REPLACE INTO cache (key, model, vec) VALUES (?, ?, ?)",
+        (cache_key(namespace, text, model), model, np.asarray(embedding, dtype=np.float32).tobytes())
+    )
+    connection.commit()
+
+
+def get_or_compute(
+    namespace: str,
+    text: str,
+    model: str,
+    fetch_fn: Callable[[str], Optional[List[float]]]
+) -> Optional[List[float]]:
+    """Return the cached embedding for a text, computing and storing it on a miss."""
+    embedding = get(namespace, text, model)
+    if embedding is not None:
+        return embedding
+
+    embedding = fetch_fn(text)
+    if embedding is not None:
+        put(namespace, text, model, embedding)
+    return embedding
+
+
+def canonical_tags(flavor_tags: Iterable[str]) -> str:
+    """Build an order- and case-insensitive cache key text for a list of flavor tags.
+
+    The key is stored in TAGS_NAMESPACE and is also the source of the text that
+    gets embedded, so a key always maps to the same embedding input.
+    """
+    return ",".join(sorted({tag.strip().lower() for tag in flavor_tags if tag.strip()}))
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Return the Levenshtein distance between two strings."""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+
+def _is_typo(tag: str, candidate: str, threshold: float) -> bool:
+    """Return whether two tags are close enough to be spellings of the same tag."""
+    distance = _edit_distance(tag, candidate)
+    return (distance <= MAX_TYPO_EDITS
+            and 1 - distance / max(len(tag), len(candidate)) >= threshold)
+
+
+def _pairs_as_typos(tags: FrozenSet[str], candidate_tags: FrozenSet[str], threshold: float) -> bool:
+    """Return whether each differing tag pairs with a distinct close spelling in the candidate."""
+    changed = sorted(tags - candidate_tags)
+    replacements = sorted(candidate_tags - tags)
+    close = [
+        [j for j, replacement in enumerate(replacements) if _is_typo(tag, replacement, threshold)]
+        for tag in changed
+    ]
+
+    # Bipartite matching by augmenting paths; tag lists are short
+    matched = {}  # Replacement index -> changed tag index
+
+    def assign(i: int, seen: set) -> bool:
+        for j in close[i]:
+            if j not in seen:
+                seen.add(j)
+                if j not in matched or assign(matched[j], seen):
+                    matched[j] = i
+                    return True
+        return False
+
+    return all(assign(i, set()) for i in range(len(changed)))
+
+
+class FuzzyIndex:
+    """In-process index reusing embeddings of recent keys that differ from a new key only by typos.
+
+    Keys are canonical tag strings from canonical_tags(). A candidate matches when
+    it has the same number of tags and every tag that differs pairs with a distinct
+    candidate tag at most MAX_TYPO_EDITS edits away, whose edit similarity
+    (1 - distance / length) is at least the threshold.
+    """
+
+    def __init__(self, threshold: float = FUZZY_THRESHOLD, max_entries: int = FUZZY_CANDIDATES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[FrozenSet[str], List[float]]]" = OrderedDict()
+
+    def add(self, key_text: str, embedding: List[float]) -> None:
+        """Remember the embedding for a key, evicting the oldest key when full."""
+        self._entries[key_text] = (frozenset(key_text.split(",")), embedding)
+        self._entries.move_to_end(key_text)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, key_text: str) -> Optional[List[float]]:
+        """Return the embedding of the most recent key that differs only by typos, if any."""
+        if self.threshold >= 1.0:
+            return None
+
+        tags = frozenset(key_text.split(","))
+        for candidate_tags, embedding in reversed(self._entries.values()):
+            if len(candidate_tags) == len(tags) and _pairs_as_typos(tags, candidate_tags, self.threshold):
+                return embedding
+        return None
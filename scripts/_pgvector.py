@@ -0,0 +1,47 @@
+"""
+pgvector Helpers
+
+Shared helpers for passing embeddings to the pgvector-backed RPC functions
+used by the scripts in this directory. Embeddings are stored as halfvec, so
+values are sent with only as many digits as float16 can represent, and are
+L2-normalized so the database can rank them by inner product.
+"""
+
+import json
+from typing import Sequence
+
+import numpy as np
+
+HALF_PRECISION_DIGITS = 5  # Significant digits needed to round-trip any float16 value
+
+
+def normalize(embedding: Sequence[float]) -> np.ndarray:
+    """Scale an embedding to unit length."""
+    values = np.asarray(embedding, dtype=np.float64)
+    return values / np.linalg.norm(values)
+
+
+def to_half_precision(embedding: Sequence[float]) -> np.ndarray:
+    """Convert an embedding to the float16 precision stored by halfvec columns."""
+    return np.asarray(embedding, dtype=np.float16)
+
+
+def _round_significant(values: np.ndarray, digits: int) -> np.ndarray:
+    """Round each value to the given number of significant digits."""
+    magnitude = np.zeros_like(values)
+    np.floor(np.log10(np.abs(values), out=magnitude, where=values != 0), out=magnitude)
+    scale = 10.0 ** (digits - 1 - magnitude)
+    # Dividing by an exact power of ten yields the float nearest the short decimal,
+    # so the JSON encoder prints it without trailing binary noise
+    return np.round(values * scale) / scale
+
+
+def to_halfvec_values(embedding: Sequence[float]) -> np.ndarray:
+    """Round an embedding to float16 precision, as values that print with the fewest digits."""
+    values = to_half_precision(embedding).astype(np.float64)
+    return _round_significant(values, HALF_PRECISION_DIGITS)
+
+
+def format_halfvec(embedding: Sequence[float]) -> str:
+    """Format an embedding as a halfvec text literal with just enough digits for float16."""
+    return json.dumps(to_halfvec_values(embedding).tolist(), separators=(",", ":"))
@@ -2,27 +2,46 @@
 """
 Apply Migration Script
 
-This script applies a migration SQL file to the Supabase database.
+This script applies one or more migration SQL files to the Supabase database,
+in the order given. The files are read concurrently before any is applied.
+
+Each migration is split into statements and sent in chunks of up to
+--max-chunk-bytes, so large migrations do not exceed the RPC payload limit.
+Each chunk runs in its own transaction; most migrations fit in a single chunk.
 """
 
 import os
 import sys
+import asyncio
 import argparse
-from pathlib import Path
-from dotenv import load_dotenv
+from typing import Iterator, List
+
+import sqlparse
 from supabase import create_client, Client
 
+from _config import SUPABASE_KEY, SUPABASE_URL
+
 # Configure basic logging
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Constants
+MAX_CHUNK_BYTES = 256 * 1024  # Largest SQL payload sent in one exec_sql call
+
 def get_args():
     """Parse command-line arguments."""
-    parser = argparse.ArgumentParser(description="Apply SQL migration")
+    parser = argparse.ArgumentParser(description="Apply SQL migrations")
+    parser.add_argument(
+        "migration_files", 
+        nargs="+",
+        help="Paths to the migration SQL files, applied in the given order"
+    )
     parser.add_argument(
-        "migration_file", 
-        help="Path to the migration SQL file"
+        "--max-chunk-bytes", 
+        type=int, 
+        default=MAX_CHUNK_BYTES,
+        help=f"Largest SQL payload sent in one request (default: {MAX_CHUNK_BYTES})"
     )
     parser.add_argument(
         "--verbose", 
@@ -33,22 +52,14 @@ def get_args():
 
 def initialize_supabase():
     """Initialize Supabase client."""
-    # Load environment variables from .env file
-    env_path = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / '.env'
-    load_dotenv(dotenv_path=env_path)
-    
-    # Get credentials from environment
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_KEY")
-    
     # Validate credentials
-    if not supabase_url or not supabase_key:
+    if not SUPABASE_URL or not SUPABASE_KEY:
         logger.error("Supabase URL and key are required (set in .env file)")
         sys.exit(1)
     
     # Initialize Supabase client
     try:
-        supabase = create_client(supabase_url, supabase_key)
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         logger.info("Supabase client initialized successfully")
         return supabase
     except Exception as e:
@@ -66,22 +77,62 @@ def read_migration_file(file_path):
         logger.error(f"Error reading migration file: {e}")
         sys.exit(1)
 
-def apply_migration(supabase, sql):
+def split_statements(sql: str) -> List[str]:
+    """Split a migration into statements, dropping pieces that only contain comments."""
+    return [
+        statement.strip()
+        for statement in sqlparse.split(sql)
+        if sqlparse.format(statement, strip_comments=True).strip()
+    ]
+
+def chunk_statements(statements: List[str], max_bytes: int) -> Iterator[str]:
+    """Group consecutive statements into chunks of at most max_bytes where possible."""
+    chunk = []
+    chunk_bytes = 0
+    for statement in statements:
+        statement_bytes = len(statement.encode()) + 1
+        # A single statement larger than max_bytes is sent on its own
+        if chunk and chunk_bytes + statement_bytes > max_bytes:
+            yield "\n".join(chunk)
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(statement)
+        chunk_bytes += statement_bytes
+    if chunk:
+        yield "\n".join(chunk)
+
+async def read_migration_files(file_paths: List[str]) -> List[str]:
+    """Read several migration files concurrently without blocking the event loop."""
+    return await asyncio.gather(
+        *[asyncio.to_thread(read_migration_file, file_path) for file_path in file_paths]
+    )
+
+def apply_migration(supabase, sql, max_chunk_bytes=MAX_CHUNK_BYTES):
     """Apply the SQL migration to the database."""
-    try:
-        # Execute the SQL as a single transaction
-        logger.info("Applying migration...")
-        response = supabase.rpc('exec_sql', {'sql': sql}).execute()
+    statements = split_statements(sql)
+    chunks = list(chunk_statements(statements, max_chunk_bytes))
+    logger.info(f"Applying migration: {len(statements)} statements in {len(chunks)} chunks...")
+    
+    for i, chunk in enumerate(chunks, start=1):
+        error = None
+        try:
+            # Each chunk executes as a single transaction
+            logger.debug(f"Applying chunk {i}/{len(chunks)} ({len(chunk.encode())} bytes)")
+            response = supabase.rpc('exec_sql', {'sql': chunk}).execute()
+            
+            if hasattr(response, 'error') and response.error:
+                error = response.error
+        except Exception as e:
+            error = e
         
-        if hasattr(response, 'error') and response.error:
-            logger.error(f"Error applying migration: {response.error}")
+        if error:
+            logger.error(f"Error applying migration chunk {i}/{len(chunks)}: {error}")
+            if i > 1:
+                logger.error(f"Chunks 1-{i - 1} were already applied")
             return False
-        
-        logger.info("Migration applied successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error applying migration: {e}")
-        return False
+    
+    logger.info("Migration applied successfully")
+    return True
 
 def main():
     """Main entry point."""
@@ -92,26 +143,27 @@ def main():
     
     logger.info("Starting migration application")
     
-    # Check if the migration file exists
-    migration_file = args.migration_file
-    if not os.path.exists(migration_file):
-        logger.error(f"Migration file does not exist: {migration_file}")
-        sys.exit(1)
+    # Check if the migration files exist
+    migration_files = args.migration_files
+    for migration_file in migration_files:
+        if not os.path.exists(migration_file):
+            logger.error(f"Migration file does not exist: {migration_file}")
+            sys.exit(1)
     
     # Initialize Supabase client
     supabase = initialize_supabase()
     
-    # Read the migration file
-    sql = read_migration_file(migration_file)
+    # Read all migration files up front
+    sqls = asyncio.run(read_migration_files(migration_files))
     
-    # Apply the migration
-    success = apply_migration(supabase, sql)
+    # Apply the migrations in order, stopping at the first failure
+    for migration_file, sql in zip(migration_files, sqls):
+        logger.info(f"Applying migration file: {migration_file}")
+        if not apply_migration(supabase, sql, args.max_chunk_bytes):
+            logger.error(f"Migration failed: {migration_file}")
+            sys.exit(1)
     
-    if success:
-        logger.info("Migration completed successfully")
-    else:
-        logger.error("Migration failed")
-        sys.exit(1)
+    logger.info("Migration completed successfully")
 
 if __name__ == "__main__":
     try:
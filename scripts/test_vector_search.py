@@ -6,14 +6,17 @@ This script tests the vector search functionality in the database to verify
 that the embeddings are working correctly.
 """
 
-import os
 import sys
 import argparse
-from pathlib import Path
-from dotenv import load_dotenv
+from functools import lru_cache
 import openai
+from postgrest.exceptions import APIError
 from supabase import create_client, Client
 
+import _embed_cache
+from _config import OPENAI_API_KEY, SUPABASE_KEY, SUPABASE_URL
+from _pgvector import format_halfvec, normalize
+
 # Configure basic logging
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,6 +25,11 @@ logger = logging.getLogger(__name__)
 # Constants
 OPENAI_MODEL = "text-embedding-ada-002"
 LIMIT = 5  # Number of results to return
+# Result fields printed by name before the remaining fields are listed
+DISPLAYED_FIELDS = frozenset({
+    'id', 'name', 'roaster_name', 'flavor_tags', 'roast_level',
+    'process_method', 'is_featured', 'price', 'similarity'
+})
 
 def get_args():
     """Parse command-line arguments."""
@@ -45,23 +53,14 @@ def get_args():
 
 def initialize_clients():
     """Initialize Supabase and OpenAI clients."""
-    # Load environment variables from .env file
-    env_path = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / '.env'
-    load_dotenv(dotenv_path=env_path)
-    
-    # Get credentials from environment
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_KEY")
-    openai_key = os.environ.get("OPENAI_API_KEY")
-    
     # Validate credentials
-    if not supabase_url or not supabase_key:
+    if not SUPABASE_URL or not SUPABASE_KEY:
         logger.error("Supabase URL and key are required (set in .env file)")
         sys.exit(1)
     
-    has_openai = bool(openai_key)
+    has_openai = bool(OPENAI_API_KEY)
     if has_openai:
-        openai.api_key = openai_key
+        openai.api_key = OPENAI_API_KEY
         logger.info("OpenAI API key configured")
     else:
         logger.warning("No OpenAI API key provided - vector search will fail")
@@ -69,19 +68,29 @@ def initialize_clients():
     
     # Initialize Supabase client
     try:
-        supabase = create_client(supabase_url, supabase_key)
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         logger.info("Supabase client initialized successfully")
         return supabase
     except Exception as e:
         logger.error(f"Failed to initialize Supabase client: {e}")
         sys.exit(1)
 
+@lru_cache(maxsize=1)
+def get_openai_client():
+    """Return the OpenAI client shared by all requests, creating it on first use."""
+    return openai.OpenAI(api_key=openai.api_key)
+
 def generate_embedding(query_text):
-    """Generate an embedding for the search query."""
+    """Generate an embedding for the search query, reusing a cached embedding when available."""
+    return _embed_cache.get_or_compute(
+        _embed_cache.QUERY_NAMESPACE, query_text, OPENAI_MODEL, fetch_embedding
+    )
+
+def fetch_embedding(query_text):
+    """Request an embedding for the search query from the OpenAI API."""
     try:
         logger.info(f"Generating embedding for query: {query_text}")
-        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        response = client.embeddings.create(
+        response = get_openai_client().embeddings.create(
             model=OPENAI_MODEL,
             input=query_text
         )
@@ -95,45 +104,34 @@ def generate_embedding(query_text):
 
 def perform_vector_search(supabase, embedding, limit):
     """Perform vector search in the database."""
+    # Convert embedding to string format for RPC call
+    embedding_str = format_halfvec(normalize(embedding))
+    
+    # Call the RPC function for vector search
+    logger.info(f"Performing vector search with limit {limit}")
+    
+    # Add debug info about the request
+    logger.info(f"Using supabase URL: {SUPABASE_URL}")
+    logger.info(f"Embedding dimensions: {len(embedding)}")
+    
     try:
-        # Convert embedding to string format for RPC call
-        embedding_str = f"[{','.join(str(float(x)) for x in embedding)}]"
-        
-        # Call the RPC function for vector search
-        logger.info(f"Performing vector search with limit {limit}")
-        
-        # Add debug info about the request
-        logger.info(f"Using supabase URL: {os.environ.get('SUPABASE_URL')}")
-        logger.info(f"Embedding dimensions: {len(embedding)}")
-        
-        # Perform the RPC call with detailed error handling
-        try:
-            result = supabase.rpc(
-                "search_coffee_by_flavor_vector",
-                {
-                    "query_embedding": embedding_str,
-                    "match_threshold": 0.5,
-                    "match_count": limit
-                }
-            ).execute()
-            
-            if result.data:
-                logger.info(f"Search successful, found {len(result.data)} results")
-                return result.data
-            else:
-                logger.warning("No search results found")
-                return []
-        except Exception as rpc_error:
-            logger.error(f"RPC call failed: {rpc_error}")
-            if hasattr(rpc_error, 'details'):
-                logger.error(f"Error details: {rpc_error.details}")
-            raise rpc_error
-    except Exception as e:
-        logger.error(f"Error performing vector search: {e}")
-        # Check if we can get more details about the error
-        if hasattr(e, '__dict__'):
-            for attr, value in e.__dict__.items():
-                logger.error(f"Error attribute {attr}: {value}")
+        result = supabase.rpc(
+            "search_coffee_by_flavor_vector",
+            {
+                "query_embedding": embedding_str,
+                "match_threshold": 0.5,
+                "match_count": limit
+            }
+        ).execute()
+    except APIError as e:
+        logger.exception(f"Vector search RPC failed: {e}")
+        return []
+    
+    if result.data:
+        logger.info(f"Search successful, found {len(result.data)} results")
+        return result.data
+    else:
+        logger.warning("No search results found")
         return []
 
 def main():
@@ -180,7 +178,7 @@ def main():
             # Print all fields for debugging
             print("\n   All available fields:")
             for key, value in coffee.items():
-                if key not in ['id', 'name', 'roaster_name', 'flavor_tags', 'roast_level', 'process_method', 'is_featured', 'price', 'similarity']:
+                if key not in DISPLAYED_FIELDS:
                     print(f"      {key}: {value}")
 
 
@@ -7,25 +7,41 @@ generating vector embeddings for each coffee's flavor tags using OpenAI.
 
 Features:
 - Robust error handling and detailed logging
-- Rate limiting to avoid API throttling
+- Token-bucket rate limiting of OpenAI requests to avoid API throttling
+- Bulk database updates, sent concurrently over a shared HTTP/2 connection
+  while later batches are embedded
 - Batched processing with progress tracking
+- One OpenAI request per batch of coffees
+- Persistent embedding cache so unchanged flavor tags are not re-embedded
+- Optional reuse of recent embeddings for flavor tags that differ only by typos
 - Command-line arguments for flexible usage
 """
 
-import os
 import sys
 import time
+import asyncio
 import json
 import argparse
+import contextlib
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime
-from pathlib import Path
-from dotenv import load_dotenv
+import re
+import zlib
+from itertools import chain, islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+from datetime import datetime, timezone
+from functools import lru_cache
 
+import httpx
+import numpy as np
 import openai
+import orjson
+from aiolimiter import AsyncLimiter
 from supabase import create_client, Client
 
+import _embed_cache
+from _config import OPENAI_API_KEY, SUPABASE_KEY, SUPABASE_URL
+from _pgvector import normalize, to_halfvec_values
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -41,8 +57,42 @@ logger = logging.getLogger(__name__)
 OPENAI_MODEL = "text-embedding-ada-002"
 VECTOR_DIMENSIONS = 1536  # OpenAI's embedding dimensions
 BATCH_SIZE = 5  # Number of coffees to process in a batch
-DELAY_BETWEEN_REQUESTS = 1.0  # Seconds between OpenAI API calls
-DELAY_BETWEEN_BATCHES = 3.0  # Seconds between batches
+MAX_BATCH_SIZE = 2048  # OpenAI limit on inputs per embeddings request
+OPENAI_REQUESTS_PER_MINUTE = 3000  # Token bucket size for OpenAI API requests
+PAGE_SIZE = 500  # Coffees fetched per database request
+OPENAI_KEEPALIVE_CONNECTIONS = 32  # Idle connections kept open to the OpenAI API
+MAX_UPDATES_PER_REQUEST = 100  # Embeddings written per bulk update RPC call
+MAX_CONCURRENT_UPDATES = 16  # Bulk update RPC calls in flight at once
+MAX_RETRIES = 5  # Attempts per RPC call when rate limited
+RETRY_BASE_DELAY = 1.0  # Seconds, doubled after each rate-limited attempt
+FALLBACK_CACHE_SIZE = 8192  # Fallback embeddings memoized per run
+
+# Preset values for common flavor descriptors used by the fallback embedding
+FLAVOR_MAP = {
+    "fruity": [0.8, 0.2, 0.1, 0.0, 0.3],
+    "chocolate": [0.2, 0.9, 0.4, 0.1, 0.1],
+    "nutty": [0.3, 0.5, 0.8, 0.2, 0.1],
+    "floral": [0.7, 0.1, 0.2, 0.1, 0.6],
+    "spicy": [0.4, 0.2, 0.7, 0.5, 0.3],
+    "sweet": [0.5, 0.6, 0.3, 0.1, 0.2],
+    "bitter": [0.1, 0.4, 0.5, 0.8, 0.1],
+    "acidic": [0.6, 0.2, 0.1, 0.7, 0.4],
+}
+FLAVOR_ROWS = {flavor: row for row, flavor in enumerate(FLAVOR_MAP)}
+FLAVOR_VECTORS = np.array(list(FLAVOR_MAP.values()), dtype=np.float32)
+# Finds every preset flavor inside a tag in a single scan; the lookahead also reports
+# flavors that overlap an earlier match, e.g. both in "acidichocolate"
+FLAVOR_PATTERN = re.compile("(?=(" + "|".join(re.escape(flavor) for flavor in FLAVOR_MAP) + "))")
+
+# Maps each embedding dimension to the base flavor dimension it repeats
+FALLBACK_PATTERN_INDEX = np.arange(VECTOR_DIMENSIONS) % FLAVOR_VECTORS.shape[1]
+# Deterministic per-dimension variation applied when extending the fallback embedding
+FALLBACK_VARIATION = 0.95 + np.array(
+    [zlib.crc32(str(i).encode()) % 10 for i in range(VECTOR_DIMENSIONS)],
+    dtype=np.float32
+) / 100
+
+Embedding = Union[List[float], np.ndarray]
 
 
 def get_args() -> argparse.Namespace:
@@ -72,19 +122,26 @@ def get_args() -> argparse.Namespace:
         "--batch-size", 
         type=int, 
         default=BATCH_SIZE,
-        help=f"Number of coffees to process in each batch (default: {BATCH_SIZE})"
+        help=f"Number of coffees to process in each batch, up to {MAX_BATCH_SIZE} (default: {BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--concurrency", 
+        type=int, 
+        default=MAX_CONCURRENT_UPDATES,
+        help=f"Maximum concurrent bulk update requests (default: {MAX_CONCURRENT_UPDATES})"
     )
     parser.add_argument(
-        "--delay", 
+        "--requests-per-minute", 
         type=float, 
-        default=DELAY_BETWEEN_REQUESTS,
-        help=f"Delay between API requests in seconds (default: {DELAY_BETWEEN_REQUESTS})"
+        default=OPENAI_REQUESTS_PER_MINUTE,
+        help=f"Maximum OpenAI API requests per minute (default: {OPENAI_REQUESTS_PER_MINUTE})"
     )
     parser.add_argument(
-        "--batch-delay", 
+        "--fuzzy-threshold", 
         type=float, 
-        default=DELAY_BETWEEN_BATCHES,
-        help=f"Delay between batches in seconds (default: {DELAY_BETWEEN_BATCHES})"
+        default=_embed_cache.FUZZY_THRESHOLD,
+        help=f"Minimum spelling similarity, in (0, 1], for a misspelled tag to reuse the embedding "
+             f"of recent tags; 1.0 disables fuzzy reuse (default: {_embed_cache.FUZZY_THRESHOLD})"
     )
     parser.add_argument(
         "--dry-run", 
@@ -97,19 +154,25 @@ def get_args() -> argparse.Namespace:
         help="Enable verbose logging"
     )
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.requests_per_minute <= 0:
+        parser.error("--requests-per-minute must be positive")
+    if not 0 < args.fuzzy_threshold <= 1:
+        parser.error("--fuzzy-threshold must be greater than 0 and at most 1")
+    
+    return args
 
 
-def initialize_clients(args: argparse.Namespace) -> Tuple[Client, bool]:
+def initialize_clients(args: argparse.Namespace) -> Tuple[Client, httpx.AsyncClient, bool]:
     """Initialize Supabase and OpenAI clients."""
-    # Load environment variables from .env file
-    env_path = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / '.env'
-    load_dotenv(dotenv_path=env_path)
-    
     # Get configuration from args or environment
-    supabase_url = args.supabase_url or os.environ.get("SUPABASE_URL")
-    supabase_key = args.supabase_key or os.environ.get("SUPABASE_KEY")
-    openai_key = args.openai_key or os.environ.get("OPENAI_API_KEY")
+    supabase_url = args.supabase_url or SUPABASE_URL
+    supabase_key = args.supabase_key or SUPABASE_KEY
+    openai_key = args.openai_key or OPENAI_API_KEY
     
     # Validate credentials
     if not supabase_url or not supabase_key:
@@ -126,192 +189,465 @@ def initialize_clients(args: argparse.Namespace) -> Tuple[Client, bool]:
     # Initialize Supabase client
     try:
         supabase = create_client(supabase_url, supabase_key)
+        rpc_client = create_rpc_client(supabase_url, supabase_key)
         logger.info("Supabase client initialized successfully")
-        return supabase, has_openai
+        return supabase, rpc_client, has_openai
     except Exception as e:
         logger.error(f"Failed to initialize Supabase client: {e}")
         sys.exit(1)
 
 
-def get_coffee_data(supabase: Client, force_all: bool = False) -> List[Dict[str, Any]]:
-    """Fetch coffee data from Supabase, focusing on coffees that need updates."""
-    try:
-        # Get all coffees with flavor tags
-        response = supabase.table('coffees').select('*').execute()
-        coffees = response.data
-        
-        if not coffees:
-            logger.warning("No coffees found with flavor tags")
-            return []
+def create_rpc_client(supabase_url: str, supabase_key: str) -> httpx.AsyncClient:
+    """Create an async HTTP/2 client for calling Supabase RPC functions concurrently."""
+    return httpx.AsyncClient(
+        http2=True,
+        base_url=supabase_url,
+        headers={
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}"
+        },
+        timeout=30.0
+    )
+
+
+async def call_rpc(client: httpx.AsyncClient, function: str, params: Dict[str, Any]) -> Any:
+    """Call a Supabase RPC function, backing off exponentially when rate limited."""
+    # orjson encodes NumPy arrays in C, without a Python call per embedding value
+    body = orjson.dumps(params, option=orjson.OPT_SERIALIZE_NUMPY)
+    for attempt in range(MAX_RETRIES):
+        response = await client.post(
+            f"/rest/v1/rpc/{function}",
+            content=body,
+            headers={"Content-Type": "application/json"}
+        )
+        if response.status_code != 429:
+            response.raise_for_status()
+            return response.json()
         
-        logger.info(f"Found {len(coffees)} total coffees with flavor tags")
+        retry_after = response.headers.get("Retry-After", "")
+        delay = float(retry_after) if retry_after.isdigit() else RETRY_BASE_DELAY * 2 ** attempt
+        logger.warning(f"Rate limited calling {function}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    
+    raise RuntimeError(f"{function} was still rate limited after {MAX_RETRIES} attempts")
+
+
+def to_utc_iso(timestamp: str) -> str:
+    """Normalize a database timestamp to an ISO-8601 UTC string."""
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        # Let the database parse formats Python does not understand
+        return timestamp
+    
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def get_last_update_time(supabase: Client) -> Optional[str]:
+    """Return the time embedding updates were last run as ISO-8601 UTC, or None if unknown."""
+    try:
+        # Let the database find the most recent successful update
+        last_update_response = (
+            supabase.table('update_logs')
+            .select('created_at')
+            .eq('operation', 'update_flavor_vector')
+            .eq('status', 'success')
+            .order('created_at', desc=True)
+            .limit(1)
+            .execute()
+        )
         
-        if force_all:
-            logger.info(f"Force update mode: will update all {len(coffees)} coffees")
-            return coffees
+        if last_update_response.data and len(last_update_response.data) > 0:
+            last_update_time = to_utc_iso(last_update_response.data[0]["created_at"])
+            logger.info(f"Last successful embedding update was at {last_update_time}")
+            return last_update_time
         
-        # Get the last time embedding updates were run
+        logger.info("No previous embedding updates found in logs")
+        return None
+    except Exception as e:
+        logger.warning(f"Could not determine last update time: {e}")
+        return None
+
+
+def get_coffee_data(supabase: Client, force_all: bool = False) -> Iterator[Dict[str, Any]]:
+    """Stream coffees that need embedding updates from Supabase, one page at a time."""
+    if force_all:
+        logger.info("Force update mode: will update all coffees")
+        last_update_time = None
+    else:
+        # Update all coffees if there were no previous updates
+        last_update_time = get_last_update_time(supabase)
+    
+    after_id = None
+    while True:
         try:
-            last_update_response = supabase.table('update_logs').select('created_at').execute()
-            
-            if last_update_response.data and len(last_update_response.data) > 0:
-                last_update_time = last_update_response.data[0]["created_at"]
-                logger.info(f"Last successful embedding update was at {last_update_time}")
-            else:
-                logger.info("No previous embedding updates found in logs")
-                return coffees  # Update all if no previous updates
+            response = supabase.rpc(
+                "coffees_needing_embeddings",
+                {
+                    "p_last_update": last_update_time,
+                    "p_after_id": after_id,
+                    "p_page_size": PAGE_SIZE
+                }
+            ).execute()
         except Exception as e:
-            logger.warning(f"Could not determine last update time: {e}")
-            return coffees  # Update all if we can't determine last update
+            # A stream cut short must not look like a complete run, or the next
+            # run's watermark would skip the coffees that were never fetched
+            logger.error(f"Error fetching coffees: {e}")
+            raise
         
-        # Filter coffees that have been updated since the last embedding update
-        need_update = []
-        for coffee in coffees:
-            coffee_updated = coffee.get("updated_at") or coffee.get("created_at")
-            if coffee_updated and coffee_updated > last_update_time:
-                need_update.append(coffee)
-            elif not coffee.get("flavor_embedding"):
-                # Also include coffees with missing embeddings
-                need_update.append(coffee)
+        rows = response.data
+        if not rows:
+            return
         
-        logger.info(f"Found {len(need_update)} coffees that need embedding updates")
-        return need_update
-    except Exception as e:
-        logger.error(f"Error fetching coffees: {e}")
-        return []
+        logger.debug(f"Fetched {len(rows)} coffees that need embedding updates")
+        yield from rows
+        after_id = rows[-1]["id"]
 
 
-def generate_openai_embedding(flavor_tags: List[str]) -> Optional[List[float]]:
-    """Generate embedding using OpenAI API."""
-    # Prepare the text for OpenAI embedding
-    text = ", ".join(flavor_tags)
-    
-    try:
-        logger.debug(f"Generating OpenAI embedding for: {text}")
-        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        response = client.embeddings.create(
-            model=OPENAI_MODEL,
-            input=text
+def create_openai_client() -> openai.AsyncOpenAI:
+    """Create the OpenAI client shared by all embedding requests of a run."""
+    # Reusing one client keeps its HTTP/2 connection open instead of
+    # resolving DNS and negotiating TLS again for every batch
+    return openai.AsyncOpenAI(
+        api_key=openai.api_key,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=OPENAI_KEEPALIVE_CONNECTIONS)
         )
+    )
+
+
+async def generate_openai_embeddings_batch(
+    client: openai.AsyncOpenAI,
+    texts: List[str],
+    limiter: AsyncLimiter
+) -> Optional[List[List[float]]]:
+    """Generate embeddings for several texts with a single OpenAI API request."""
+    try:
+        logger.debug(f"Generating OpenAI embeddings for {len(texts)} texts")
+        # Only waits when the per-minute request budget is used up
+        async with limiter:
+            response = await client.embeddings.create(
+                model=OPENAI_MODEL,
+                input=texts
+            )
         
-        # Extract the embedding from the response
-        embedding = response.data[0].embedding
+        # The API reports each embedding's position in the input list
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         
-        # Validate dimensions
-        if len(embedding) != VECTOR_DIMENSIONS:
-            logger.error(f"Invalid embedding dimensions: got {len(embedding)}, expected {VECTOR_DIMENSIONS}")
+        # Validate count and dimensions
+        if len(embeddings) != len(texts):
+            logger.error(f"Invalid embedding count: got {len(embeddings)}, expected {len(texts)}")
             return None
+        for embedding in embeddings:
+            if len(embedding) != VECTOR_DIMENSIONS:
+                logger.error(f"Invalid embedding dimensions: got {len(embedding)}, expected {VECTOR_DIMENSIONS}")
+                return None
         
-        return embedding
+        return embeddings
     except Exception as e:
-        logger.error(f"Error generating OpenAI embedding: {e}")
+        logger.error(f"Error generating OpenAI embeddings: {e}")
         return None
 
 
-def generate_fallback_embedding(flavor_tags: List[str]) -> List[float]:
-    """Generate a simple fallback embedding when OpenAI is unavailable."""
-    # Create a simple embedding based on preset values for common flavor descriptors
-    flavor_map = {
-        "fruity": [0.8, 0.2, 0.1, 0.0, 0.3],
-        "chocolate": [0.2, 0.9, 0.4, 0.1, 0.1],
-        "nutty": [0.3, 0.5, 0.8, 0.2, 0.1],
-        "floral": [0.7, 0.1, 0.2, 0.1, 0.6],
-        "spicy": [0.4, 0.2, 0.7, 0.5, 0.3],
-        "sweet": [0.5, 0.6, 0.3, 0.1, 0.2],
-        "bitter": [0.1, 0.4, 0.5, 0.8, 0.1],
-        "acidic": [0.6, 0.2, 0.1, 0.7, 0.4],
-    }
-    
-    # Generate a composite embedding based on the flavor tags
-    base_vector = [0.1] * 5  # Starting point
+async def generate_openai_embeddings_split(
+    client: openai.AsyncOpenAI,
+    texts: List[str],
+    limiter: AsyncLimiter
+) -> List[Optional[List[float]]]:
+    """Generate embeddings for several texts, retrying failed requests in halves.
+
+    A single input the API rejects would otherwise fail every text sent with it;
+    splitting isolates it so only its own embedding is None.
+    """
+    embeddings = await generate_openai_embeddings_batch(client, texts, limiter)
+    if embeddings is not None:
+        return embeddings
+    if len(texts) == 1:
+        return [None]
     
+    middle = len(texts) // 2
+    logger.warning(f"Retrying {len(texts)} embedding inputs as two requests")
+    first, second = await asyncio.gather(
+        generate_openai_embeddings_split(client, texts[:middle], limiter),
+        generate_openai_embeddings_split(client, texts[middle:], limiter)
+    )
+    return first + second
+
+
+async def generate_openai_embeddings_cached(
+    client: openai.AsyncOpenAI,
+    flavor_tag_lists: List[List[str]],
+    limiter: AsyncLimiter,
+    fuzzy_index: _embed_cache.FuzzyIndex,
+    cache_stats: Dict[str, int]
+) -> List[Optional[List[float]]]:
+    """Generate embeddings for several flavor tag lists, only requesting the ones not already cached."""
+    # Cache by canonical tags so reordered or re-cased tags reuse the same embedding
+    keys = [_embed_cache.canonical_tags(flavor_tags) for flavor_tags in flavor_tag_lists]
+    embeddings = [_embed_cache.get(_embed_cache.TAGS_NAMESPACE, key, OPENAI_MODEL) for key in keys]
+    exact_hits = sum(embedding is not None for embedding in embeddings)
+    
+    # Fall back to near-duplicates of recently seen tags
+    fuzzy_hits = set()
+    for i, key in enumerate(keys):
+        if embeddings[i] is None:
+            embeddings[i] = fuzzy_index.lookup(key)
+            if embeddings[i] is not None:
+                logger.debug(f"Reusing near-duplicate embedding for flavor tags: {key}")
+                fuzzy_hits.add(i)
+    
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    logger.info(f"Embedding cache: {exact_hits} exact hits, {len(fuzzy_hits)} fuzzy hits, {len(missing)} misses")
+    cache_stats["exact"] += exact_hits
+    cache_stats["fuzzy"] += len(fuzzy_hits)
+    cache_stats["miss"] += len(missing)
+    
+    if missing:
+        # Request each distinct set of tags once, even if several coffees in the batch share it
+        missing_keys = list(dict.fromkeys(keys[i] for i in missing))
+        # Embed the canonical tags rather than one coffee's raw tags, so what is cached
+        # under a key does not depend on which coffee happened to miss first
+        texts = [", ".join(key.split(",")) for key in missing_keys]
+        fetched = await generate_openai_embeddings_split(client, texts, limiter)
+        fetched_by_key = dict(zip(missing_keys, fetched))
+        for key, embedding in fetched_by_key.items():
+            if embedding is not None:
+                _embed_cache.put(_embed_cache.TAGS_NAMESPACE, key, OPENAI_MODEL, embedding)
+        for i in missing:
+            embeddings[i] = fetched_by_key[keys[i]]
+    
+    # Only index embeddings generated for the key itself, so near-duplicates cannot chain
+    for i, (key, embedding) in enumerate(zip(keys, embeddings)):
+        if embedding is not None and i not in fuzzy_hits:
+            fuzzy_index.add(key, embedding)
+    
+    return embeddings
+
+
+def _match_flavor(tag: str) -> Optional[int]:
+    """Return the row of the first preset flavor contained in a lowercase tag."""
+    matches = FLAVOR_PATTERN.findall(tag)
+    return min(FLAVOR_ROWS[flavor] for flavor in matches) if matches else None
+
+
+def generate_fallback_embedding(flavor_tags: List[str]) -> np.ndarray:
+    """Generate a simple fallback embedding when OpenAI is unavailable."""
+    # The embedding ignores tag order and case, so coffees sharing tags share one result
+    return _fallback_embedding(tuple(sorted(tag.lower() for tag in flavor_tags)))
+
+
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def _fallback_embedding(flavor_tags: Tuple[str, ...]) -> np.ndarray:
+    """Compute the fallback embedding for sorted, lowercase flavor tags."""
+    # Find the closest matching preset flavor for each tag
+    rows = []
+    unmatched = 0
     for tag in flavor_tags:
-        tag_lower = tag.lower()
-        # Find the closest matching flavor in our map
-        matched = False
-        for flavor, vector in flavor_map.items():
-            if flavor in tag_lower:
-                # Add the flavor's vector to our base vector
-                base_vector = [base + (0.5 * flavor_val) for base, flavor_val in zip(base_vector, vector)]
-                matched = True
-                break
-        
-        # If no match, add a small random component
-        if not matched:
-            base_vector = [val + 0.05 for val in base_vector]
+        row = _match_flavor(tag)
+        if row is None:
+            unmatched += 1
+        else:
+            rows.append(row)
+    
+    # Composite of the matched flavors, with a small component for each unmatched tag
+    base_vector = 0.1 + 0.05 * unmatched + 0.5 * FLAVOR_VECTORS[rows].sum(axis=0)
     
     # Normalize the vector
-    magnitude = sum(val**2 for val in base_vector) ** 0.5
-    normalized = [val / magnitude for val in base_vector]
+    base_vector /= np.linalg.norm(base_vector)
     
     # Extend to full dimensions by repeating pattern with small variations
-    full_embedding = []
-    while len(full_embedding) < VECTOR_DIMENSIONS:
-        for val in normalized:
-            # Add small variation
-            variation = val * (0.95 + (hash(str(len(full_embedding))) % 10) / 100)
-            full_embedding.append(variation)
-            if len(full_embedding) >= VECTOR_DIMENSIONS:
-                break
-    
-    return full_embedding[:VECTOR_DIMENSIONS]
+    embedding = base_vector[FALLBACK_PATTERN_INDEX] * FALLBACK_VARIATION
+    # Shared by every caller with the same tags, so it must not be modified
+    embedding.flags.writeable = False
+    return embedding
 
 
-def update_coffee_embedding(
-    supabase: Client, 
-    coffee: Dict[str, Any], 
-    has_openai: bool,
+async def bulk_update_embeddings(
+    client: httpx.AsyncClient, 
+    semaphore: asyncio.Semaphore,
+    updates: List[Dict[str, Any]]
+) -> List[str]:
+    """Store several embeddings with one RPC call, returning the ids of the updated coffees."""
+    async with semaphore:
+        result = await call_rpc(
+            client,
+            "bulk_update_coffee_flavor_vectors",
+            {"p_updates": updates}
+        )
+    return result or []
+
+
+async def store_embeddings(
+    client: httpx.AsyncClient, 
+    semaphore: asyncio.Semaphore,
+    coffees: List[Dict[str, Any]], 
+    embeddings: List[Optional[Embedding]],
     dry_run: bool
-) -> bool:
-    """Update the embedding for a single coffee."""
-    coffee_id = coffee["id"]
-    coffee_name = coffee.get("coffee_name", "Unknown")
-    flavor_tags = coffee["flavor_tags"]
+) -> int:
+    """Store the embeddings generated for a batch of coffees, returning how many were updated."""
+    updates = []
+    for coffee, embedding in zip(coffees, embeddings):
+        if embedding is None:
+            logger.error(f"Failed to generate embedding for coffee {coffee['id']}")
+            continue
+        
+        # Normalize so similarity search can use the inner product, then round to the
+        # half precision stored by PostgreSQL; the JSON text of each array is a valid
+        # halfvec literal
+        updates.append({
+            "id": coffee["id"],
+            "embedding": to_halfvec_values(normalize(embedding))
+        })
     
-    if not flavor_tags:
-        logger.warning(f"Coffee {coffee_id} ({coffee_name}) has no flavor tags, skipping")
-        return False
+    if dry_run:
+        for update in updates:
+            logger.info(f"DRY RUN: Would update coffee {update['id']} with embedding of {update['embedding'].size} dimensions")
+        return len(updates)
     
-    logger.info(f"Processing coffee {coffee_id} ({coffee_name}) with flavor tags: {', '.join(flavor_tags)}")
+    # Write the batch with as few RPC calls as the request size limit allows
+    chunks = [
+        updates[i:i + MAX_UPDATES_PER_REQUEST]
+        for i in range(0, len(updates), MAX_UPDATES_PER_REQUEST)
+    ]
+    results = await asyncio.gather(
+        *[bulk_update_embeddings(client, semaphore, chunk) for chunk in chunks],
+        return_exceptions=True
+    )
     
-    # Generate embedding
-    embedding = None
-    if has_openai:
-        embedding = generate_openai_embedding(flavor_tags)
-    else:
-        embedding = generate_fallback_embedding(flavor_tags)
+    updated = 0
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error updating embeddings for {len(chunk)} coffees: {result}")
+            continue
+        
+        updated_ids = set(result)
+        for update in chunk:
+            if update["id"] not in updated_ids:
+                logger.error(f"Coffee with ID {update['id']} not found")
+        updated += len(updated_ids)
+    
+    logger.info(f"Successfully updated embeddings for {updated} coffees")
+    return updated
+
+
+async def wait_for_writes(
+    pending: Dict["asyncio.Task[int]", int],
+    return_when: str = asyncio.ALL_COMPLETED
+) -> Tuple[int, int]:
+    """Wait for pending batch writes, returning (updated, failed) for the ones that finished."""
+    done, _ = await asyncio.wait(pending, return_when=return_when)
+    updated = 0
+    failed = 0
+    for task in done:
+        batch_updated = task.result()
+        updated += batch_updated
+        failed += pending.pop(task) - batch_updated
+    return updated, failed
+
+
+async def process_coffees(
+    rpc_client: httpx.AsyncClient,
+    coffees: Iterable[Dict[str, Any]],
+    has_openai: bool,
+    args: argparse.Namespace
+) -> Tuple[int, int]:
+    """Generate and store embeddings for the coffees in batches, returning (updated, failed)."""
+    start_time = time.time()
+    processed = 0
+    updated = 0
+    failed = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limiter = AsyncLimiter(args.requests_per_minute, 60)
+    fuzzy_index = _embed_cache.FuzzyIndex(threshold=args.fuzzy_threshold)
+    cache_stats = {"exact": 0, "fuzzy": 0, "miss": 0}
     
-    if not embedding:
-        logger.error(f"Failed to generate embedding for coffee {coffee_id}")
-        return False
+    # Process in batches
+    batch_size = args.batch_size
     
-    # Format embedding for PostgreSQL
-    embedding_str = f"[{','.join(str(float(x)) for x in embedding)}]"
-    logger.debug(f"Generated embedding with {len(embedding)} dimensions")
+    logger.info(f"Starting update with batch size {batch_size} and concurrency {args.concurrency}")
+    if args.dry_run:
+        logger.info("DRY RUN MODE: No actual updates will be made")
     
-    if dry_run:
-        logger.info(f"DRY RUN: Would update coffee {coffee_id} with embedding of {len(embedding)} dimensions")
-        return True
+    coffees = iter(coffees)
+    batch_num = 0
+    # Batch writes still in flight, with the number of coffees each one stores
+    pending: Dict["asyncio.Task[int]", int] = {}
+    # Both clients are closed before asyncio.run() closes the event loop they are bound to
+    openai_client = create_openai_client() if has_openai else None
     
-    # Update the database using our RPC function
-    try:
-        result = supabase.rpc(
-            "update_coffee_flavor_vector",
-            {
-                "p_coffee_id": coffee_id,
-                "p_embedding": embedding_str
-            }
-        ).execute()
+    async with rpc_client, openai_client if has_openai else contextlib.nullcontext():
+        try:
+            while True:
+                # The stream fetches pages with the blocking Supabase client, so read it in a
+                # worker thread to keep pending writes and OpenAI requests moving meanwhile
+                batch = await asyncio.to_thread(list, islice(coffees, batch_size))
+                if not batch:
+                    break
+                batch_num += 1
+                
+                logger.info(f"Processing batch {batch_num} ({len(batch)} coffees)")
+                
+                # Coffees without flavor tags, or with only blank ones, have nothing to embed
+                embeddable = []
+                for coffee in batch:
+                    if _embed_cache.canonical_tags(coffee.get("flavor_tags") or []):
+                        logger.info(f"Processing coffee {coffee['id']} ({coffee.get('coffee_name', 'Unknown')}) with flavor tags: {', '.join(coffee['flavor_tags'])}")
+                        embeddable.append(coffee)
+                    else:
+                        logger.warning(f"Coffee {coffee['id']} ({coffee.get('coffee_name', 'Unknown')}) has no flavor tags, skipping")
+                        failed += 1
+                
+                # Generate all uncached embeddings for the batch with one OpenAI request,
+                # split up only if the API rejects it
+                if has_openai:
+                    embeddings = await generate_openai_embeddings_cached(
+                        openai_client,
+                        [coffee["flavor_tags"] for coffee in embeddable],
+                        limiter,
+                        fuzzy_index,
+                        cache_stats
+                    )
+                else:
+                    embeddings = [generate_fallback_embedding(coffee["flavor_tags"]) for coffee in embeddable]
+                
+                # Store the batch's embeddings in the background while the next batch is embedded,
+                # keeping at most as many batch writes pending as bulk updates may run at once
+                if len(pending) >= args.concurrency:
+                    batch_updated, batch_failed = await wait_for_writes(pending, asyncio.FIRST_COMPLETED)
+                    updated += batch_updated
+                    failed += batch_failed
+                write = asyncio.create_task(
+                    store_embeddings(rpc_client, semaphore, embeddable, embeddings, args.dry_run)
+                )
+                pending[write] = len(embeddable)
+                
+                # Report progress
+                processed += len(batch)
+                elapsed = time.time() - start_time
+                rate = processed / elapsed if elapsed > 0 else 0
+                
+                logger.info(f"Progress: {processed} coffees processed")
+                logger.info(f"Rate: {rate:.2f} coffees/sec, Elapsed: {elapsed:.1f}s")
+                logger.info(f"Updated: {updated}, Failed: {failed}")
         
-        if result.data is True:
-            logger.info(f"Successfully updated embedding for coffee {coffee_id}")
-            return True
-        else:
-            logger.error(f"RPC function returned failure for coffee {coffee_id}")
-            return False
-    except Exception as e:
-        logger.error(f"Error updating embedding for coffee {coffee_id}: {e}")
-        return False
+        finally:
+            # Let writes already started finish before the clients close, even if the stream failed
+            if pending:
+                batch_updated, batch_failed = await wait_for_writes(pending)
+                updated += batch_updated
+                failed += batch_failed
+    
+    lookups = sum(cache_stats.values())
+    if lookups:
+        logger.info(
+            f"Embedding cache hit rate: {cache_stats['exact'] / lookups:.1%} exact, "
+            f"{cache_stats['fuzzy'] / lookups:.1%} fuzzy ({cache_stats['miss']} misses)"
+        )
+    
+    return updated, failed
 
 
 def main():
@@ -326,13 +662,15 @@ def main():
     logger.info("Starting coffee embedding update script")
     
     # Initialize clients
-    supabase, has_openai = initialize_clients(args)
+    supabase, rpc_client, has_openai = initialize_clients(args)
     
-    # Get coffees that need updates
+    # Stream coffees that need updates, checking the first one before starting
     coffees = get_coffee_data(supabase, args.force_all)
-    if not coffees:
+    first_coffee = next(coffees, None)
+    if first_coffee is None:
         logger.info("No coffees need updating, exiting")
         return
+    coffees = chain([first_coffee], coffees)
         
     if not has_openai and not args.force_all:
         logger.warning("No OpenAI API key but attempting to update embeddings!")
@@ -341,50 +679,8 @@ def main():
             logger.info("Operation cancelled by user")
             return
     
-    # Set up tracking
     start_time = time.time()
-    total_coffees = len(coffees)
-    updated = 0
-    failed = 0
-    
-    # Process in batches
-    batch_size = args.batch_size
-    
-    logger.info(f"Starting update with batch size {batch_size}")
-    if args.dry_run:
-        logger.info("DRY RUN MODE: No actual updates will be made")
-    
-    for i in range(0, total_coffees, batch_size):
-        batch = coffees[i:i+batch_size]
-        batch_num = i // batch_size + 1
-        total_batches = (total_coffees + batch_size - 1) // batch_size
-        
-        logger.info(f"Processing batch {batch_num}/{total_batches} ({len(batch)} coffees)")
-        
-        for coffee in batch:
-            success = update_coffee_embedding(supabase, coffee, has_openai, args.dry_run)
-            if success:
-                updated += 1
-            else:
-                failed += 1
-            
-            # Add delay between requests
-            if args.delay > 0 and coffee != batch[-1]:
-                time.sleep(args.delay)
-        
-        # Report progress
-        progress = (i + len(batch)) / total_coffees * 100
-        elapsed = time.time() - start_time
-        rate = (i + len(batch)) / elapsed if elapsed > 0 else 0
-        
-        logger.info(f"Progress: {progress:.1f}% ({i + len(batch)}/{total_coffees})")
-        logger.info(f"Rate: {rate:.2f} coffees/sec, Elapsed: {elapsed:.1f}s")
-        logger.info(f"Updated: {updated}, Failed: {failed}")
-        
-        # Add delay between batches
-        if i + batch_size < total_coffees and args.batch_delay > 0:
-            logger.info(f"Waiting {args.batch_delay}s before next batch...")
-            time.sleep(args.batch_delay)
+    updated, failed = asyncio.run(process_coffees(rpc_client, coffees, has_openai, args))
     
     # Final report
     total_time = time.time() - start_time
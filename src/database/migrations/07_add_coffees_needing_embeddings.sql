@@ -0,0 +1,44 @@
+-- 07_add_coffees_needing_embeddings.sql
+-- Page through coffees whose flavor embeddings need to be regenerated
+
+-- Returns only the columns needed to build embeddings (never flavor_embedding itself),
+-- using keyset pagination on id so callers can stream large catalogs page by page.
+-- Ordering by id keeps the cursor stable while rows are being updated, since
+-- updating an embedding changes updated_at but never id.
+CREATE OR REPLACE FUNCTION coffees_needing_embeddings(
+  p_last_update timestamptz DEFAULT NULL,
+  p_after_id uuid DEFAULT NULL,
+  p_page_size int DEFAULT 500
+)
+RETURNS TABLE (
+  id uuid,
+  coffee_name text,
+  flavor_tags text[],
+  updated_at timestamptz
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    c.id,
+    c.coffee_name,
+    c.flavor_tags,
+    c.updated_at
+  FROM
+    coffees c
+  WHERE
+    (p_after_id IS NULL OR c.id > p_after_id) AND
+    (
+      -- A NULL last update means every coffee needs an embedding
+      p_last_update IS NULL OR
+      COALESCE(c.updated_at, c.created_at) > p_last_update OR
+      c.flavor_embedding IS NULL
+    )
+  ORDER BY
+    c.id
+  LIMIT
+    p_page_size;
+$$;
+
+-- Grant execute permissions
+GRANT EXECUTE ON FUNCTION coffees_needing_embeddings(timestamptz, uuid, int) TO service_role;
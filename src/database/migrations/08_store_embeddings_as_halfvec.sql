@@ -0,0 +1,213 @@
+-- 08_store_embeddings_as_halfvec.sql
+-- Store flavor embeddings in half precision (requires pgvector >= 0.7)
+-- halfvec halves the storage and index size of each 1536-dimension embedding,
+-- which is ample precision for cosine similarity between normalized vectors
+
+-- Drop the existing index to allow column type change
+DROP INDEX IF EXISTS coffees_flavor_embedding_idx;
+
+-- Convert existing embeddings to half precision
+ALTER TABLE coffees
+  ALTER COLUMN flavor_embedding TYPE halfvec(1536) USING flavor_embedding::halfvec(1536);
+
+-- Recreate the HNSW index on the halfvec column
+CREATE INDEX coffees_flavor_embedding_idx
+ON coffees USING hnsw (flavor_embedding halfvec_cosine_ops);
+
+-- Recreate the update RPC to cast incoming embeddings to halfvec
+CREATE OR REPLACE FUNCTION update_coffee_flavor_vector(
+  p_coffee_id UUID,
+  p_embedding TEXT
+) RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  log_id INT;
+  dimensions INT;
+  start_time TIMESTAMPTZ;
+  end_time TIMESTAMPTZ;
+  execution_time INTERVAL;
+  coffee_exists BOOLEAN;
+BEGIN
+  -- Record start time for performance logging
+  start_time := NOW();
+  
+  -- Initial log entry
+  INSERT INTO update_logs (
+    entity_id, entity_type, operation, details, status
+  ) VALUES (
+    p_coffee_id, 'coffee', 'update_flavor_vector',
+    format('Starting vector update for coffee %s', p_coffee_id),
+    'started'
+  ) RETURNING id INTO log_id;
+  
+  -- Check if the coffee exists
+  SELECT EXISTS(SELECT 1 FROM coffees WHERE id = p_coffee_id) INTO coffee_exists;
+  
+  IF NOT coffee_exists THEN
+    -- Log the error for non-existent coffee
+    UPDATE update_logs SET 
+      details = format('Coffee with ID %s not found', p_coffee_id),
+      status = 'error',
+      created_at = NOW()
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Coffee with ID % not found', p_coffee_id;
+    RETURN FALSE;
+  END IF;
+  
+  -- Validate embedding format and dimensions
+  BEGIN
+    -- Calculate approximate dimensions from the embedding string
+    SELECT (LENGTH(p_embedding) - LENGTH(REPLACE(p_embedding, ',', '')) + 1) INTO dimensions;
+    
+    -- Log the dimensions check
+    UPDATE update_logs SET 
+      details = format('Validated embedding format with ~%s dimensions', dimensions),
+      created_at = NOW()
+    WHERE id = log_id;
+  EXCEPTION WHEN OTHERS THEN
+    -- Log validation error
+    UPDATE update_logs SET 
+      details = format('Error validating embedding format: %s', SQLERRM),
+      status = 'error',
+      created_at = NOW()
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Error validating embedding format: %', SQLERRM;
+    RETURN FALSE;
+  END;
+  
+  BEGIN
+    -- Update the coffee with the new embedding
+    UPDATE coffees
+    SET 
+      flavor_embedding = p_embedding::halfvec(1536),
+      updated_at = NOW()
+    WHERE id = p_coffee_id;
+    
+    -- Record end time and calculate execution time
+    end_time := NOW();
+    execution_time := end_time - start_time;
+    
+    -- Log successful update
+    UPDATE update_logs SET 
+      details = format('Successfully updated embedding for coffee %s in %s ms', 
+                      p_coffee_id, 
+                      EXTRACT(MILLISECONDS FROM execution_time)),
+      status = 'success',
+      created_at = NOW()
+    WHERE id = log_id;
+    
+    RETURN TRUE;
+  EXCEPTION WHEN OTHERS THEN
+    -- Log database error
+    UPDATE update_logs SET 
+      details = format('Error updating embedding: %s', SQLERRM),
+      status = 'error',
+      created_at = NOW()
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Error updating embedding: %', SQLERRM;
+    RETURN FALSE;
+  END;
+END;
+$$;
+
+-- Grant appropriate permissions on the function
+GRANT EXECUTE ON FUNCTION update_coffee_flavor_vector TO service_role;
+
+-- Drop the vector versions of the search functions so the halfvec versions do not
+-- become ambiguous overloads
+DROP FUNCTION IF EXISTS search_coffee_by_flavor_vector(vector(1536), float, int, int, float, float);
+DROP FUNCTION IF EXISTS count_coffee_by_flavor_vector(vector(1536), float);
+
+-- Recreate the search function taking a halfvec query embedding
+CREATE OR REPLACE FUNCTION search_coffee_by_flavor_vector(
+  query_embedding halfvec(1536),
+  match_threshold float DEFAULT 0.5,
+  match_count int DEFAULT 5,
+  match_offset int DEFAULT 0,
+  vector_weight float DEFAULT 0.8,
+  featured_weight float DEFAULT 0.2
+)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  roaster_id uuid,
+  roaster_name text,
+  roast_level text,
+  process_method text,
+  description text,
+  price decimal,
+  image_url text,
+  product_url text,
+  flavor_tags text[],
+  is_featured boolean,
+  similarity float,
+  distance float
+) 
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    c.id,
+    c.coffee_name as name,
+    c.roaster_id,
+    r.roaster_name as roaster_name,
+    c.roast_level,
+    c.process_method,
+    c.description,
+    c.price,
+    c.image_url,
+    c.product_url,
+    c.flavor_tags,
+    c.is_featured,
+    -- Calculate the weighted similarity score
+    (
+      vector_weight * (1 - (c.flavor_embedding <=> query_embedding)) +
+      featured_weight * (CASE WHEN c.is_featured THEN 1.0 ELSE 0.0 END)
+    ) as similarity,
+    -- Include the raw distance for debugging and advanced filtering
+    (c.flavor_embedding <=> query_embedding) as distance
+  FROM 
+    coffees c
+  LEFT JOIN 
+    roasters r ON c.roaster_id = r.id
+  WHERE 
+    c.flavor_embedding IS NOT NULL AND
+    (1 - (c.flavor_embedding <=> query_embedding)) > match_threshold
+  ORDER BY 
+    similarity DESC
+  LIMIT 
+    match_count
+  OFFSET
+    match_offset;
+END;
+$$;
+
+-- Recreate the count function taking a halfvec query embedding
+CREATE OR REPLACE FUNCTION count_coffee_by_flavor_vector(
+  query_embedding halfvec(1536),
+  match_threshold float DEFAULT 0.5
+) 
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  match_count bigint;
+BEGIN
+  SELECT COUNT(*) INTO match_count
+  FROM coffees
+  WHERE flavor_embedding IS NOT NULL
+  AND 1 - (flavor_embedding <=> query_embedding) > match_threshold;
+  
+  RETURN match_count;
+END;
+$$;
+
+-- Grant execute permissions
+GRANT EXECUTE ON FUNCTION search_coffee_by_flavor_vector(halfvec(1536), float, int, int, float, float) TO service_role;
+GRANT EXECUTE ON FUNCTION count_coffee_by_flavor_vector(halfvec(1536), float) TO service_role;
@@ -0,0 +1,112 @@
+-- 09_use_inner_product_for_flavor_search.sql
+-- Compare unit-length flavor embeddings by inner product instead of cosine distance
+-- For L2-normalized vectors the inner product equals cosine similarity, so the
+-- search can skip computing vector norms for every compared row.
+-- Writers are expected to store normalized embeddings (OpenAI embeddings already
+-- are, and the embedding update script normalizes before storing).
+
+-- Normalize embeddings stored before this migration
+UPDATE coffees
+SET flavor_embedding = l2_normalize(flavor_embedding)
+WHERE flavor_embedding IS NOT NULL;
+
+-- Rebuild the HNSW index with inner product operators
+DROP INDEX IF EXISTS coffees_flavor_embedding_idx;
+
+CREATE INDEX coffees_flavor_embedding_idx
+ON coffees USING hnsw (flavor_embedding halfvec_ip_ops);
+
+-- Recreate the search function using the inner product
+-- (<#> returns the negative inner product, so similarity is its negation)
+CREATE OR REPLACE FUNCTION search_coffee_by_flavor_vector(
+  query_embedding halfvec(1536),
+  match_threshold float DEFAULT 0.5,
+  match_count int DEFAULT 5,
+  match_offset int DEFAULT 0,
+  vector_weight float DEFAULT 0.8,
+  featured_weight float DEFAULT 0.2
+)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  roaster_id uuid,
+  roaster_name text,
+  roast_level text,
+  process_method text,
+  description text,
+  price decimal,
+  image_url text,
+  product_url text,
+  flavor_tags text[],
+  is_featured boolean,
+  similarity float,
+  distance float
+) 
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Normalize the query once so the inner product equals cosine similarity
+  query_embedding := l2_normalize(query_embedding);
+  
+  RETURN QUERY
+  SELECT
+    c.id,
+    c.coffee_name as name,
+    c.roaster_id,
+    r.roaster_name as roaster_name,
+    c.roast_level,
+    c.process_method,
+    c.description,
+    c.price,
+    c.image_url,
+    c.product_url,
+    c.flavor_tags,
+    c.is_featured,
+    -- Calculate the weighted similarity score
+    (
+      vector_weight * (-(c.flavor_embedding <#> query_embedding)) +
+      featured_weight * (CASE WHEN c.is_featured THEN 1.0 ELSE 0.0 END)
+    ) as similarity,
+    -- Include the cosine distance for debugging and advanced filtering
+    (1 + (c.flavor_embedding <#> query_embedding)) as distance
+  FROM 
+    coffees c
+  LEFT JOIN 
+    roasters r ON c.roaster_id = r.id
+  WHERE 
+    c.flavor_embedding IS NOT NULL AND
+    -(c.flavor_embedding <#> query_embedding) > match_threshold
+  ORDER BY 
+    similarity DESC
+  LIMIT 
+    match_count
+  OFFSET
+    match_offset;
+END;
+$$;
+
+-- Recreate the count function using the inner product
+CREATE OR REPLACE FUNCTION count_coffee_by_flavor_vector(
+  query_embedding halfvec(1536),
+  match_threshold float DEFAULT 0.5
+) 
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  match_count bigint;
+BEGIN
+  query_embedding := l2_normalize(query_embedding);
+  
+  SELECT COUNT(*) INTO match_count
+  FROM coffees
+  WHERE flavor_embedding IS NOT NULL
+  AND -(flavor_embedding <#> query_embedding) > match_threshold;
+  
+  RETURN match_count;
+END;
+$$;
+
+-- Grant execute permissions
+GRANT EXECUTE ON FUNCTION search_coffee_by_flavor_vector(halfvec(1536), float, int, int, float, float) TO service_role;
+GRANT EXECUTE ON FUNCTION count_coffee_by_flavor_vector(halfvec(1536), float) TO service_role;
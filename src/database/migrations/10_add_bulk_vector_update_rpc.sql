@@ -0,0 +1,47 @@
+-- 10_add_bulk_vector_update_rpc.sql
+-- Update many flavor embeddings with a single RPC call
+
+-- Takes a JSON array of {"id": uuid, "embedding": [...]} objects and applies them
+-- in one UPDATE, so a whole batch costs one round-trip and one transaction instead
+-- of one update_coffee_flavor_vector call per coffee. JSON is used rather than
+-- parallel uuid[]/halfvec[] arguments because PostgREST would read nested JSON
+-- arrays as a multi-dimensional array. Each embedding's JSON text is a valid
+-- halfvec literal. Returns the ids of the coffees that were updated.
+CREATE OR REPLACE FUNCTION bulk_update_coffee_flavor_vectors(
+  p_updates JSONB
+) RETURNS UUID[]
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  updated_ids UUID[];
+BEGIN
+  WITH updated AS (
+    UPDATE coffees c
+    SET 
+      flavor_embedding = v.embedding::halfvec(1536),
+      updated_at = NOW()
+    FROM jsonb_to_recordset(p_updates) AS v(id UUID, embedding TEXT)
+    WHERE c.id = v.id
+    RETURNING c.id
+  ),
+  logged AS (
+    -- Log each update so later runs can detect changes since the last update
+    INSERT INTO update_logs (
+      entity_id, entity_type, operation, details, status
+    )
+    SELECT
+      id, 'coffee', 'update_flavor_vector',
+      format('Successfully updated embedding for coffee %s in bulk', id),
+      'success'
+    FROM updated
+    RETURNING entity_id
+  )
+  SELECT COALESCE(array_agg(entity_id), '{}') INTO updated_ids FROM logged;
+  
+  RETURN updated_ids;
+END;
+$$;
+
+-- Grant appropriate permissions on the function
+GRANT EXECUTE ON FUNCTION bulk_update_coffee_flavor_vectors(JSONB) TO service_role;